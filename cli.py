@@ -1,28 +1,35 @@
 # cli.py (updated run-bytecode handling)
+import contextlib
+import dataclasses
+import logging
+import logging.handlers
+import os
+import queue
 import sys
 import time
 import threading
 from flowc import parser
 from flowc import semantic, ir as irmod, codegen, bytecode as bcmod
 from flowrun.runtime import Runtime
-from flowrun.runtime_parallel import ParallelRuntime
 from flowrun.vm import ParallelVM, load_bytecode
-from flowc.visualize import render_workflow_to_file
-from flowrun.metrics import start_metrics_server
 
 USAGE = """
 Usage:
   python cli.py parse <file>
   python cli.py check <file>
   python cli.py transpile <file> <out.py>
-  python cli.py emit-bytecode <file> <out.bc.json>
-  python cli.py run-bytecode <out.bc.json> [mem_limit_mb] [max_workers]
+  python cli.py emit-bytecode <file> <out.bc.json|out.bc.msgpack>
+  python cli.py run-bytecode <out.bc.json|out.bc.msgpack> [mem_limit_mb] [max_workers]
   python cli.py run <file>
   python cli.py run-parallel <file> [max_workers] [mem_limit_mb]
   python cli.py visualize <file> <out.png|out.svg>
+
+Environment:
+  FLOWRUN_LOG_LEVEL   log level for run output (DEBUG, INFO, WARNING, ERROR; default INFO)
 """
 
 def do_run_with_monitor(bytecode_path, port: int = 8000, mem_limit_mb=None, max_workers=None):
+    from flowrun.metrics import start_metrics_server
     # start metrics server in background thread (start_http_server is non-blocking but this ensures clarity)
     start_metrics_server(int(port))
 
@@ -32,66 +39,97 @@ def do_run_with_monitor(bytecode_path, port: int = 8000, mem_limit_mb=None, max_
     bc = load_bytecode(bytecode_path)
     vm = ParallelVM(bc, mem_limit_mb=(int(mem_limit_mb) if mem_limit_mb else None),
                     max_workers=(int(max_workers) if max_workers else None))
-    ok = vm.execute()
+    with _run_logging():
+        ok = vm.execute()
     print("VM completed" if ok else "VM failed")
+
+@contextlib.contextmanager
+def _run_logging():
+    """
+    Route the 'flowrun' logger through a QueueHandler for the duration of
+    a run: worker threads only enqueue records and one listener thread
+    writes them to stdout. FLOWRUN_LOG_LEVEL (default INFO) picks the
+    level; DEBUG shows attempts.
+    """
+    name = os.environ.get("FLOWRUN_LOG_LEVEL", "INFO").upper()
+    level = logging.getLevelName(name)
+    if not isinstance(level, int):
+        print(f"Unknown FLOWRUN_LOG_LEVEL {name!r}; using INFO", file=sys.stderr)
+        level = logging.INFO
+    q = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(q, handler)
+    queue_handler = logging.handlers.QueueHandler(q)
+    log = logging.getLogger("flowrun")
+    saved_level, saved_propagate = log.level, log.propagate
+    log.addHandler(queue_handler)
+    log.setLevel(level)
+    log.propagate = False
+    listener.start()
+    try:
+        yield
+    finally:
+        listener.stop()
+        log.removeHandler(queue_handler)
+        log.setLevel(saved_level)
+        log.propagate = saved_propagate
+
+def _read_and_parse(path):
+    # silent parse used by every command; only `parse` prints the AST
+    return parser.parse(parser.read_source(path))
+
 def do_parse(path):
-    src = open(path).read()
-    ast = parser.parse(src)
+    ast = _read_and_parse(path)
     print(ast)
     return ast
 
 def do_check(path):
-    ast = do_parse(path)
+    ast = _read_and_parse(path)
     order = semantic.semantic_check(ast)
     print("Semantic OK. Topo order:", order)
     return ast, order
 
 def do_transpile(path, out):
     ast, order = do_check(path)
-    ir = irmod.workflow_to_ir(ast)
-    name_to_instr = {instr["step"]: instr for instr in ir}
-    ordered_ir = [name_to_instr[n] for n in order]
-    codegen.transpile(ordered_ir, out)
+    ir = irmod.workflow_to_ir(ast, order=order)
+    codegen.transpile(ir, out)
 
 def do_emit_bytecode(path, outbc):
     ast, order = do_check(path)
-    ir = irmod.workflow_to_ir(ast)
-    # convert notifies AST objects to simple dicts
-    notifies = []
-    for n in getattr(ast, "notifies", []):
-        notifies.append({
-            "name": n.name,
-            "email": getattr(n, "email", None),
-            "subject": getattr(n, "subject", None),
-            "body": getattr(n, "body", None)
-        })
+    ir = irmod.workflow_to_ir(ast, order=order)
+    # Notify fields map 1:1 onto the bytecode notify dicts
+    notifies = [dataclasses.asdict(n) for n in ast.notifies]
     bcmod.emit_bytecode(ast.name, ir, outbc, notifies=notifies)
 
 
 def do_run_bytecode(path, mem_limit_mb=None, max_workers=None):
     bc = load_bytecode(path)
     vm = ParallelVM(bc, mem_limit_mb=(int(mem_limit_mb) if mem_limit_mb else None), max_workers=(int(max_workers) if max_workers else None))
-    ok = vm.execute()
+    with _run_logging():
+        ok = vm.execute()
     print("VM completed" if ok else "VM failed")
 
 # remaining functions unchanged...
 def do_run(path):
     ast, order = do_check(path)
-    ir = irmod.workflow_to_ir(ast)
-    name_to_instr = {instr["step"]: instr for instr in ir}
-    ordered_ir = [name_to_instr[n] for n in order]
-    r = Runtime(ordered_ir)
-    ok = r.execute()
+    ir = irmod.workflow_to_ir(ast, order=order)
+    r = Runtime(ir)
+    with _run_logging():
+        ok = r.execute()
     print("Workflow completed" if ok else "Workflow failed")
 
 def do_run_parallel(path, max_workers=None, mem_limit_mb=None):
+    from flowrun.runtime_parallel import ParallelRuntime
     ast, order = do_check(path)
     ir = irmod.workflow_to_ir(ast)
     r = ParallelRuntime(ir, max_workers=(int(max_workers) if max_workers else None), mem_limit_mb=(int(mem_limit_mb) if mem_limit_mb else None))
-    ok = r.execute()
+    with _run_logging():
+        ok = r.execute()
     print("Workflow completed" if ok else "Workflow failed")
 
 def do_visualize(path, outpath):
+    from flowc.visualize import render_workflow_to_file
     ast, order = do_check(path)
     out = render_workflow_to_file(ast, outpath)
     print("Rendered:", out)
@@ -1,9 +1,8 @@
-from lark import Lark, Tree
-grammar = open("grammar.lark").read()
+from flowc.parser import get_parser, read_source
 
-parser = Lark(grammar, start="start", parser="lalr", propagate_positions=True)
+parser = get_parser()
 
-src = open("examples/backup.flow").read()
+src = read_source("examples/backup.flow")
 tree = parser.parse(src)
 
 print(tree.pretty())
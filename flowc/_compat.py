@@ -0,0 +1,15 @@
+# flowc/_compat.py
+# optional speedups shared by flowc, flowrun and the web UI; each name is
+# None when the package is not installed and callers fall back to stdlib json
+
+# orjson is much faster than stdlib json and yields bytes directly
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+# msgpack is only needed for the compact binary bytecode format
+try:
+    import msgpack
+except Exception:
+    msgpack = None
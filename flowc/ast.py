@@ -2,7 +2,7 @@ from dataclasses import dataclass, field
 from typing import List, Optional
 
 
-@dataclass
+@dataclass(slots=True)
 class Step:
     name: str
     run: Optional[str] = None
@@ -12,7 +12,7 @@ class Step:
     on_error: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Notify:
     name: str
     email: Optional[str] = None
@@ -20,7 +20,7 @@ class Notify:
     body: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Workflow:
     name: str
     triggers: List[str]
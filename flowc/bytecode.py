@@ -3,13 +3,18 @@ import json
 import os
 from typing import List, Dict, Optional
 
-def emit_bytecode(workflow_name: str, ir: List[dict], out_path: str, notifies: Optional[List[Dict]] = None):
+from flowc._compat import orjson, msgpack
+
+def emit_bytecode(workflow_name: str, ir: List[dict], out_path: str, notifies: Optional[List[Dict]] = None,
+                  fmt: Optional[str] = None):
     """
-    Emit a JSON bytecode file from IR and optional notifies list.
+    Emit a bytecode file from IR and optional notifies list.
+    fmt is 'json' (human-readable) or 'msgpack' (smaller, faster to load);
+    by default it is picked from the extension (.msgpack -> msgpack).
     Format:
     {
       "workflow": "<name>",
-      "steps": [...],
+      "steps": [...],      # IR instructions, incl. numeric "timeout_sec"
       "notifies": [...]
     }
     """
@@ -20,7 +25,18 @@ def emit_bytecode(workflow_name: str, ir: List[dict], out_path: str, notifies: O
     }
     if notifies:
         bc["notifies"] = notifies
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(bc, f, indent=2)
+    if fmt is None:
+        fmt = "msgpack" if out_path.endswith(".msgpack") else "json"
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("msgpack bytecode requires the 'msgpack' package")
+        with open(out_path, "wb") as f:
+            f.write(msgpack.packb(bc, use_bin_type=True))
+    elif orjson is not None:
+        with open(out_path, "wb") as f:
+            f.write(orjson.dumps(bc, option=orjson.OPT_INDENT_2))
+    else:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(bc, f, indent=2)
     print(f"Bytecode emitted -> {out_path}")
     return out_path
@@ -1,17 +1,40 @@
 # flowc/ir.py
-from typing import List
+import functools
+from typing import List, Optional
 
-def workflow_to_ir(workflow):
+@functools.lru_cache(maxsize=256)
+def parse_timeout(timeout) -> Optional[int]:
+    """
+    Convert a DSL duration ("30s", "30" or None) to whole seconds.
+    Returns None when there is no usable timeout.
+    Memoized: workflows reuse a handful of distinct durations.
+    """
+    if not timeout:
+        return None
+    try:
+        return int(str(timeout).rstrip("s"))
+    except ValueError:
+        return None
+
+def workflow_to_ir(workflow, order: Optional[List[str]] = None):
     """
     Produce a simple IR: list of instructions (dicts) describing steps.
+    If order (e.g. the topo order from semantic_check) is given, the
+    instructions are emitted in that order; otherwise in source order.
     """
+    steps = workflow.steps
+    timeouts = {s.name: parse_timeout(s.timeout) for s in steps}
+    if order is not None:
+        by_name = {s.name: s for s in steps}
+        steps = [by_name[name] for name in order]
     ir = []
-    for s in workflow.steps:
+    for s in steps:
         instr = {
             "op": "RUN",
             "step": s.name,
             "cmd": s.run,
             "timeout": s.timeout,
+            "timeout_sec": timeouts[s.name],
             "retries": s.retries,
             "depends_on": s.depends_on,
             "on_error": s.on_error
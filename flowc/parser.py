@@ -1,18 +1,73 @@
+import hashlib
+import mmap
+import os
+import stat
+import sys
 from lark import Lark
 from .transformer import FlowTransformer
 
 
 GRAMMAR_FILE = 'grammar.lark'
 
+_PARSER = None
+_TRANSFORMER = None
+
+
+def read_source(path):
+    """
+    Read a UTF-8 source file through a read-only mmap, decoding straight
+    from the mapped pages instead of going through a buffered text read.
+    Pipes and other non-regular files are read normally.
+    """
+    with open(path, 'rb') as f:
+        # mmap cannot map an empty file, and pipes/FIFOs report size 0
+        st = os.fstat(f.fileno())
+        if not (stat.S_ISREG(st.st_mode) and st.st_size):
+            return f.read().decode('utf-8')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return str(mm, 'utf-8')
+
+
+def _cache_path(grammar):
+    """
+    Path for Lark's pickled LALR tables in a per-user directory, or False
+    to disable the on-disk cache. The cache is unpickled at startup, so it
+    must never live somewhere other users can write (cache=True would use
+    a predictable name in the shared system tmp dir).
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    cache_dir = os.path.join(base, 'flowscript')
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        st = os.stat(cache_dir)
+    except OSError:
+        return False
+    if hasattr(os, 'getuid') and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+        return False
+    digest = hashlib.md5(grammar.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, 'grammar_%s_%d%d.lark' % ((digest,) + sys.version_info[:2]))
+
 
 def get_parser():
-    g = open(GRAMMAR_FILE).read()
-    return Lark(g, start='start', parser='lalr', propagate_positions=True)
+    # built once per process; the on-disk cache lets Lark reload the pickled
+    # LALR tables on later process starts instead of recomputing them
+    global _PARSER
+    if _PARSER is None:
+        g = read_source(GRAMMAR_FILE)
+        _PARSER = Lark(g, start='start', parser='lalr', propagate_positions=True, cache=_cache_path(g))
+    return _PARSER
+
+
+def get_transformer():
+    # FlowTransformer keeps no state between transforms, so one instance is enough
+    global _TRANSFORMER
+    if _TRANSFORMER is None:
+        _TRANSFORMER = FlowTransformer()
+    return _TRANSFORMER
 
 
 def parse(text):
     parser = get_parser()
     tree = parser.parse(text)
-    transformer = FlowTransformer()
-    ast = transformer.transform(tree)
-    return ast
\ No newline at end of file
+    ast = get_transformer().transform(tree)
+    return ast
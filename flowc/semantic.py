@@ -1,7 +1,18 @@
 # flowc/semantic.py
-from typing import List
+from typing import Dict, List, Optional
 from .ast import Workflow, Step
+import heapq
 import re
+import threading
+
+# hyperscan (optional) compiles all banned patterns into one automaton that
+# scans a command in a single pass; without it the re alternation is used.
+# Both must flag the same commands: hyperscan runs in UTF-8/Unicode mode so
+# \s also matches non-ASCII whitespace, like re does on str
+try:
+    import hyperscan
+except Exception:
+    hyperscan = None
 
 BANNED_PATTERNS = [
     r"rm\s+-rf",
@@ -11,6 +22,27 @@ BANNED_PATTERNS = [
     r"`"                   # backticks
 ]
 
+# one alternation scanned once per command; group p<i> names BANNED_PATTERNS[i]
+_BANNED_RE = re.compile("|".join(f"(?P<p{i}>{p})" for i, p in enumerate(BANNED_PATTERNS)))
+
+def _compile_hyperscan(patterns: List[str]):
+    if hyperscan is None:
+        return None
+    try:
+        n = len(patterns)
+        db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+        db.compile(expressions=[p.encode() for p in patterns], ids=list(range(n)), elements=n,
+                   flags=[hyperscan.HS_FLAG_DOTALL | hyperscan.HS_FLAG_SINGLEMATCH
+                          | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP] * n)
+        return db
+    except Exception:
+        # e.g. a pattern hyperscan does not support (backreferences, lookaround)
+        return None
+
+_BANNED_HS = _compile_hyperscan(BANNED_PATTERNS)
+# a database shares one scratch space, so scans must not run concurrently
+_BANNED_HS_LOCK = threading.Lock()
+
 class SemanticError(Exception):
     pass
 
@@ -28,58 +60,61 @@ def check_missing_dependencies(steps: List[Step]):
             if d not in names:
                 raise SemanticError(f"Step '{s.name}' depends on missing step '{d}'")
 
-def detect_cycle(steps: List[Step]):
-    # Kahn's algorithm for cycle detection
-    graph = {s.name: set(s.depends_on) for s in steps}
-    indeg = {n: len(graph[n]) for n in graph}
-    queue = [n for n, d in indeg.items() if d == 0]
-    order = []
-    queue.sort()
-    while queue:
-        n = queue.pop(0)
-        order.append(n)
-        for m in list(graph.keys()):
-            if n in graph[m]:
-                graph[m].remove(n)
-                indeg[m] -= 1
-                if indeg[m] == 0:
-                    queue.append(m)
-        queue.sort()
-    if len(order) != len(steps):
-        raise SemanticError("Cycle detected in step dependencies")
+def _find_banned(cmd: str) -> Optional[str]:
+    # returns the first banned pattern found in cmd, or None
+    if _BANNED_HS is not None:
+        hits = []
+
+        def on_match(pattern_id, start, end, flags, context):
+            hits.append(pattern_id)
+            return True  # stop scanning at the first match
+
+        with _BANNED_HS_LOCK:
+            try:
+                _BANNED_HS.scan(cmd.encode(), match_event_handler=on_match)
+            except hyperscan.ScanTerminated:
+                pass
+        return BANNED_PATTERNS[hits[0]] if hits else None
+    m = _BANNED_RE.search(cmd)
+    return BANNED_PATTERNS[int(m.lastgroup[1:])] if m else None
 
 def check_banned_commands(steps: List[Step]):
     for s in steps:
         if s.run:
-            for pat in BANNED_PATTERNS:
-                if re.search(pat, s.run):
-                    raise SemanticError(f"Banned pattern in step '{s.name}': pattern '{pat}' matched")
+            pat = _find_banned(s.run)
+            if pat is not None:
+                raise SemanticError(f"Banned pattern in step '{s.name}': pattern '{pat}' matched")
+
+def _successors(steps: List[Step]) -> Dict[str, List[str]]:
+    succ = {s.name: [] for s in steps}
+    for s in steps:
+        for dep in s.depends_on:
+            if dep not in succ:
+                raise SemanticError(f"Step '{s.name}' depends on missing step '{dep}'")
+            succ[dep].append(s.name)
+    return succ
 
 def build_dag(steps: List[Step]) -> List[str]:
-    # deterministic topological sort using Kahn's algorithm
-    graph = {s.name: set(s.depends_on) for s in steps}
-    indeg = {n: len(graph[n]) for n in graph}
-    queue = [n for n, d in indeg.items() if d == 0]
+    # deterministic topological sort using Kahn's algorithm; also detects cycles
+    succ = _successors(steps)
+    indeg = {s.name: len(s.depends_on) for s in steps}
+    ready = [n for n, d in indeg.items() if d == 0]
+    heapq.heapify(ready)
     order = []
-    queue.sort()
-    while queue:
-        n = queue.pop(0)
+    while ready:
+        n = heapq.heappop(ready)
         order.append(n)
-        for m in list(graph.keys()):
-            if n in graph[m]:
-                graph[m].remove(n)
-                indeg[m] -= 1
-                if indeg[m] == 0:
-                    queue.append(m)
-        queue.sort()
+        for m in succ[n]:
+            indeg[m] -= 1
+            if indeg[m] == 0:
+                heapq.heappush(ready, m)
     if len(order) != len(steps):
-        raise SemanticError("Cycle detected when building DAG")
+        raise SemanticError("Cycle detected in step dependencies")
     return order
 
 def semantic_check(workflow: Workflow) -> List[str]:
     check_duplicates(workflow.steps)
     check_missing_dependencies(workflow.steps)
-    detect_cycle(workflow.steps)
-    check_banned_commands(workflow.steps)
     order = build_dag(workflow.steps)
+    check_banned_commands(workflow.steps)
     return order
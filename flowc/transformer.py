@@ -1,7 +1,18 @@
 # flowc/transformer.py
+from itertools import chain
 from lark import Transformer, Token
 from .ast import Workflow, Step, Notify
 
+# step field tag -> setter applied to the Step being built
+# ('when' is parsed but not applied yet, so it has no entry)
+_STEP_SETTERS = {
+    'run': lambda s, v: setattr(s, 'run', v),
+    'timeout': lambda s, v: setattr(s, 'timeout', v),
+    'retries': lambda s, v: setattr(s, 'retries', int(v)),
+    'depends_on': lambda s, v: s.depends_on.append(v),
+    'on_error': lambda s, v: setattr(s, 'on_error', v),
+}
+
 class FlowTransformer(Transformer):
     # Token conversions
     def NAME(self, tok: Token):
@@ -50,23 +61,9 @@ class FlowTransformer(Transformer):
         # items: NAME, env_body (which might be a list-of-items or nested list)
         name = items[0]
         rest = items[1:]
-        # Flatten nested lists (safely)
-        flat = []
-        for it in rest:
-            if isinstance(it, list) or isinstance(it, tuple):
-                for v in it:
-                    flat.append(v)
-            else:
-                flat.append(it)
-
-        # Now flat should be [KEY, VALUE, KEY2, VALUE2, ...]
-        d = {}
-        i = 0
-        while i < len(flat):
-            key = flat[i]
-            val = flat[i+1] if i+1 < len(flat) else None
-            d[key] = val
-            i += 2
+        # Flatten nested lists, then pair up [KEY, VALUE, KEY2, VALUE2, ...]
+        pairs = chain.from_iterable(it if isinstance(it, (list, tuple)) else (it,) for it in rest)
+        d = dict(zip(pairs, pairs))
         return ('env', name, d)
 
     def step(self, items):
@@ -74,19 +71,12 @@ class FlowTransformer(Transformer):
         body = items[1:]
         s = Step(name=name)
         for b in body:
-            if isinstance(b, tuple):
-                tag = b[0]
-                if tag == 'run':
-                    s.run = b[1]
-                elif tag == 'timeout':
-                    s.timeout = b[1]
-                elif tag == 'retries':
-                    s.retries = int(b[1])
-                elif tag == 'depends_on':
-                    s.depends_on.append(b[1])
-                elif tag == 'on_error':
-                    s.on_error = b[1]
-                elif tag == 'when':
+            match b:
+                case tuple((str() as tag, value)):
+                    handler = _STEP_SETTERS.get(tag)
+                    if handler:
+                        handler(s, value)
+                case _:
                     pass
         return s
 
@@ -113,12 +103,15 @@ class FlowTransformer(Transformer):
         steps = []
         notifies = []
         for item in body:
-            if isinstance(item, tuple) and item[0] == 'trigger':
-                triggers.append((item[1], item[2]))
-            elif isinstance(item, tuple) and item[0] == 'env':
-                env.update(item[2])
-            elif isinstance(item, Step):
-                steps.append(item)
-            elif isinstance(item, Notify):
-                notifies.append(item)
+            match item:
+                case tuple(('trigger', kind, value)):
+                    triggers.append((kind, value))
+                case tuple(('env', _, values)):
+                    env.update(values)
+                case Step():
+                    steps.append(item)
+                case Notify():
+                    notifies.append(item)
+                case _:
+                    pass
         return Workflow(name=name, triggers=triggers, env=env, steps=steps, notifies=notifies)
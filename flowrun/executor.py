@@ -1,8 +1,16 @@
 # flowrun/executor.py
+import functools
 import subprocess
 import os
+import shlex
+import shutil
+import sys
+import threading
 import time
-from typing import Optional
+import uuid
+from typing import List, Optional, Union
+
+from flowc.ir import parse_timeout
 
 # Try to import resource (POSIX). It may be missing on Windows or constrained builds.
 try:
@@ -24,6 +32,131 @@ def _can_setrlimit() -> bool:
     return resource is not None and hasattr(resource, "setrlimit") and hasattr(resource, "RLIMIT_AS")
 
 
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+@functools.lru_cache(maxsize=None)
+def _cgroup_parent() -> Optional[str]:
+    """
+    cgroup v2 directory under which per-step memory cgroups can be created:
+    this process's own cgroup, if it is writable and already has the memory
+    controller enabled for children (e.g. a delegated systemd scope). The
+    process is never moved and no controller is enabled on its behalf, so
+    cgroups it does not own are left alone. None if cgroup v2 delegation is
+    not available (non-Linux, cgroup v1, rootless without delegation, ...).
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        rel = None
+        with open("/proc/self/cgroup", "r") as fh:
+            for line in fh:
+                if line.startswith("0::"):
+                    rel = line[3:].strip()
+        if rel is None:
+            return None
+        parent = os.path.join(CGROUP_ROOT, rel.lstrip("/"))
+        with open(os.path.join(parent, "cgroup.subtree_control"), "r") as fh:
+            if "memory" not in fh.read().split():
+                return None
+        return parent if os.access(parent, os.W_OK) else None
+    except OSError:
+        return None
+
+
+def _create_memory_cgroup(mem_limit_mb: int) -> Optional[str]:
+    """
+    Create a transient cgroup with memory.max set to mem_limit_mb.
+    Returns its path, or None if that is not possible.
+    """
+    parent = _cgroup_parent()
+    if parent is None:
+        return None
+    path = os.path.join(parent, f"flowscript-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    try:
+        os.mkdir(path)
+        with open(os.path.join(path, "memory.max"), "w") as fh:
+            fh.write(str(int(mem_limit_mb) * 1024 * 1024))
+    except OSError:
+        _remove_cgroup(path)
+        return None
+    try:
+        # keep the limit from being dodged by swapping (best-effort)
+        with open(os.path.join(path, "memory.swap.max"), "w") as fh:
+            fh.write("0")
+    except OSError:
+        pass
+    return path
+
+
+def _kill_cgroup(path: str, proc: subprocess.Popen):
+    """
+    Kill every process in the cgroup (cgroup.kill needs Linux 5.14+;
+    otherwise kill the pids listed in cgroup.procs).
+    """
+    try:
+        with open(os.path.join(path, "cgroup.kill"), "w") as fh:
+            fh.write("1")
+        return
+    except OSError:
+        pass
+    try:
+        proc.kill()
+    except Exception:
+        pass
+    try:
+        with open(os.path.join(path, "cgroup.procs"), "r") as fh:
+            for pid in fh.read().split():
+                try:
+                    os.kill(int(pid), 9)
+                except Exception:
+                    pass
+    except OSError:
+        pass
+
+
+def _remove_cgroup(path: str):
+    # rmdir only succeeds once the last member has exited; retry briefly
+    for _ in range(20):
+        try:
+            os.rmdir(path)
+            return
+        except FileNotFoundError:
+            return
+        except OSError:
+            time.sleep(0.05)
+
+
+def _run_in_cgroup(cmd: Union[str, List[str]], cwd: str, cgroup: str, timeout: Optional[int]) -> Optional[bool]:
+    """
+    Run cmd inside cgroup; the kernel enforces memory.max (OOM kill) so no
+    polling is needed, only a wait with timeout.
+    Returns None if the child could not be placed in the cgroup.
+    """
+    procs_file = os.path.join(cgroup, "cgroup.procs")
+
+    def _join_cgroup():
+        # runs in the child before exec; "0" means the writing process
+        with open(procs_file, "w") as fh:
+            fh.write("0")
+
+    try:
+        proc = subprocess.Popen(cmd, shell=isinstance(cmd, str), cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                preexec_fn=_join_cgroup)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    try:
+        proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill_cgroup(cgroup, proc)
+        try:
+            proc.communicate(timeout=5)
+        except Exception:
+            pass
+        return False
+    return proc.returncode == 0
+
+
 def _kill_process_tree(processes):
     """
     Kill a list of psutil.Process or Popen-like objects if possible.
@@ -136,21 +269,162 @@ def _monitor_and_enforce(proc: subprocess.Popen, mem_limit_mb: Optional[int], ti
         time.sleep(poll_interval)
 
 
-def run_cmd_sandbox(cmd: str,
+# anything the shell would interpret (expansion, redirection, pipes, lists,
+# globbing, comments, ...) keeps a command on the /bin/sh path
+_SHELL_CHARS = frozenset("|&;<>()$`\\*?[]{}~#!\n")
+# reserved words and builtins that act on the shell itself; some distros ship
+# /usr/bin stubs for a few of them (cd, read, umask, ...), so which() is not enough
+_SHELL_WORDS = frozenset((
+    "if", "then", "else", "elif", "fi", "case", "esac", "for", "while", "until", "do", "done",
+    "in", "function", "select", "time", ".", ":", "alias", "bg", "break", "cd", "command",
+    "continue", "eval", "exec", "exit", "export", "fg", "getopts", "hash", "jobs", "local",
+    "read", "readonly", "return", "set", "shift", "source", "times", "trap", "type", "ulimit",
+    "umask", "unalias", "unset", "wait",
+))
+
+
+def _compile_argv(cmd: str) -> Optional[List[str]]:
+    """
+    argv for commands that need no shell: a plain executable found on PATH
+    plus literal (possibly quoted) arguments. None means run via the shell.
+    """
+    if os.name == "nt" or not cmd or not _SHELL_CHARS.isdisjoint(cmd):
+        return None
+    try:
+        argv = shlex.split(cmd)
+    except ValueError:
+        return None
+    if not argv or "/" in argv[0] or "=" in argv[0] or argv[0] in _SHELL_WORDS:
+        return None
+    exe = shutil.which(argv[0])
+    if exe is None:
+        # other builtins or a typo: let sh handle it
+        return None
+    return [exe] + argv[1:]
+
+
+class CompiledStep:
+    """
+    Per-step run constants resolved once from an IR/bytecode instruction,
+    so the retry loop reads attributes instead of dict lookups and parses.
+    argv is set when the command can be exec'd directly without /bin/sh;
+    run_target is what to hand to run_cmd_sandbox.
+    """
+    __slots__ = ("name", "cmd", "argv", "timeout_sec", "retries_plus_1", "on_error", "depends_on")
+
+    def __init__(self, instr: dict):
+        self.name = instr["step"]
+        self.cmd = instr.get("cmd") or ""
+        self.argv = _compile_argv(self.cmd)
+        # IR/bytecode carry timeout_sec pre-parsed; older bytecode only has the raw string
+        self.timeout_sec = instr["timeout_sec"] if "timeout_sec" in instr else parse_timeout(instr.get("timeout"))
+        self.retries_plus_1 = (instr.get("retries", 0) or 0) + 1
+        self.on_error = instr.get("on_error")
+        self.depends_on = tuple(instr.get("depends_on") or ())
+
+    @property
+    def run_target(self) -> Union[str, List[str]]:
+        return self.argv if self.argv is not None else self.cmd
+
+
+class ShellPool:
+    """
+    Long-lived /bin/sh coprocesses (one per worker thread) for running many
+    short commands without paying a fresh shell fork+exec per step.
+      - Each command runs as `( eval <cmd> ) </dev/null` so cd/exit/syntax
+        errors stay inside a subshell and cannot desync the coprocess.
+      - The exit status is read back from a sentinel line printed after it.
+      - POSIX only; no timeout or memory enforcement (callers fall back to
+        the Popen path for steps that need those).
+    """
+
+    def __init__(self, cwd: Optional[str] = None):
+        self.cwd = cwd or os.getcwd()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shells = []
+        self._sentinel = f"@@FLOWSCRIPT-EXIT-{uuid.uuid4().hex}@@ ".encode()
+
+    def _shell(self) -> subprocess.Popen:
+        sh = getattr(self._local, "shell", None)
+        if sh is None or sh.poll() is not None:
+            os.makedirs(self.cwd, exist_ok=True)
+            sh = subprocess.Popen(["/bin/sh"], cwd=self.cwd, stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            self._local.shell = sh
+            with self._lock:
+                self._shells.append(sh)
+        return sh
+
+    def run(self, cmd: str) -> bool:
+        """
+        Run cmd in this thread's shell. Returns True on exit code 0.
+        """
+        sh = self._shell()
+        sentinel = self._sentinel.decode()
+        script = f"( eval {shlex.quote(cmd)} ) </dev/null\nprintf '\\n{sentinel}%d\\n' $?\n"
+        try:
+            sh.stdin.write(script.encode())
+            sh.stdin.flush()
+            # command output is discarded, as in run_cmd_sandbox
+            for line in sh.stdout:
+                if line.startswith(self._sentinel):
+                    return int(line[len(self._sentinel):]) == 0
+        except (OSError, ValueError):
+            pass
+        # shell died or pipe broke: drop it so the next call starts a new one
+        self._local.shell = None
+        return False
+
+    def close(self):
+        with self._lock:
+            shells, self._shells = self._shells, []
+        for sh in shells:
+            try:
+                sh.stdin.close()
+                sh.wait(timeout=1)
+            except Exception:
+                try:
+                    sh.kill()
+                except Exception:
+                    pass
+
+
+def run_cmd_sandbox(cmd: Union[str, List[str]],
                     timeout: Optional[int] = None,
                     mem_limit_mb: Optional[int] = None,
-                    cwd: Optional[str] = None) -> bool:
+                    cwd: Optional[str] = None,
+                    shell_pool: Optional[ShellPool] = None) -> bool:
     """
     Cross-platform sandbox runner.
       - Creates working directory if missing.
-      - On POSIX, tries resource.setrlimit (best-effort) before exec.
-      - Uses psutil (if available) to monitor memory on all platforms.
+      - On Linux with cgroup v2 delegation, puts the command in its own
+        cgroup with memory.max so the kernel enforces mem_limit_mb.
+      - Otherwise, on POSIX, tries resource.setrlimit (best-effort) before exec
+        and uses psutil (if available) to monitor memory on all platforms.
       - Enforces timeout and kills process tree on violations.
+      - If shell_pool is given and the step has neither timeout nor memory
+        limit, runs the command in the pool's reused shell (in the pool's cwd).
+      - cmd may be an argv list (see CompiledStep.argv), exec'd without a shell.
     Returns True if command succeeded (exit code 0), False otherwise.
     """
+    if shell_pool is not None and timeout is None and mem_limit_mb is None:
+        return shell_pool.run(cmd if isinstance(cmd, str) else shlex.join(cmd))
+    shell = isinstance(cmd, str)
+
     cwd = cwd or os.getcwd()
     os.makedirs(cwd, exist_ok=True)
 
+    cgroup = _create_memory_cgroup(mem_limit_mb) if mem_limit_mb and os.name != 'nt' else None
+    if cgroup is not None:
+        try:
+            ok = _run_in_cgroup(cmd, cwd, cgroup, timeout)
+        finally:
+            _remove_cgroup(cgroup)
+        if ok is not None:
+            return ok
+        # could not join the cgroup: fall back to rlimit + polling below
+
     # POSIX preexec to set RLIMIT_AS if available (best-effort)
     preexec_fn = None
     if os.name != 'nt' and _can_setrlimit() and mem_limit_mb:
@@ -165,10 +439,13 @@ def run_cmd_sandbox(cmd: str,
 
     # Start process with Popen so we can monitor/kill it on Windows
     try:
-        proc = subprocess.Popen(cmd, shell=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=preexec_fn)
+        proc = subprocess.Popen(cmd, shell=shell, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=preexec_fn)
     except TypeError:
         # Some Windows Pythons/platforms may error if preexec_fn passed unexpectedly; fallback
-        proc = subprocess.Popen(cmd, shell=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        proc = subprocess.Popen(cmd, shell=shell, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError:
+        # argv form: executable vanished since compile time (a shell would exit 127)
+        return False
 
     success = _monitor_and_enforce(proc, mem_limit_mb, timeout)
 
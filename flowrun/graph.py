@@ -0,0 +1,53 @@
+# flowrun/graph.py
+from array import array
+from typing import Dict, List, Sequence
+
+from flowc.semantic import SemanticError
+
+class StepGraph:
+    """
+    Step dependency graph in CSR form for the parallel runtimes.
+      - steps get integer ids in name order, so (-bottom_level, id) heap
+        entries tie-break by name exactly like (-bottom_level, name) did.
+      - the children of id i are targets[offsets[i]:offsets[i+1]].
+      - indeg is a mutable array('i'); the runtime decrements it in place.
+    """
+    __slots__ = ("names", "name_to_id", "offsets", "targets", "indeg")
+
+    def __init__(self, depends_on: Dict[str, Sequence[str]]):
+        self.names: List[str] = sorted(depends_on)
+        name_to_id = {n: i for i, n in enumerate(self.names)}
+        n_steps = len(self.names)
+        children: List[List[int]] = [[] for _ in range(n_steps)]
+        indeg = array("i", [0]) * n_steps
+        for name, deps in depends_on.items():
+            i = name_to_id[name]
+            for dep in deps:
+                d = name_to_id.get(dep)
+                if d is None:
+                    raise SemanticError(f"Step '{name}' depends on unknown step '{dep}'")
+                children[d].append(i)
+                indeg[i] += 1
+        offsets = array("i", [0])
+        targets = array("i")
+        for ch in children:
+            targets.extend(ch)
+            offsets.append(len(targets))
+        self.name_to_id = name_to_id
+        self.offsets = offsets
+        self.targets = targets
+        self.indeg = indeg
+
+    def roots(self) -> List[int]:
+        return [i for i, d in enumerate(self.indeg) if d == 0]
+
+    def bottom_levels(self, order: Sequence[int], weights: Sequence[int]) -> List[int]:
+        """
+        Longest weighted path from each step to a leaf; order must be a
+        topological order of every step id.
+        """
+        offsets, targets = self.offsets, self.targets
+        bottom = [0] * len(self.names)
+        for i in reversed(order):
+            bottom[i] = weights[i] + max((bottom[t] for t in targets[offsets[i]:offsets[i + 1]]), default=0)
+        return bottom
@@ -1,35 +1,59 @@
 # flowrun/runtime.py
-from flowrun.executor import run_cmd_sandbox
-from typing import List
+import logging
+import os
+import threading
+from flowrun.executor import run_cmd_sandbox, ShellPool, CompiledStep
+from flowrun.scheduler import DAGScheduler, ABORT
+from typing import Dict, List, Optional
+
+log = logging.getLogger("flowrun")
+
+# scheduler status -> Runtime.state value
+_STATE = {"queued": "PENDING", "running": "RUNNING", "succeeded": "OK", "failed": "FAILED"}
 
 class Runtime:
-    def __init__(self, ir: List[dict], workdir: str = "/tmp/flowscript_run"):
+    """
+    Dependency-driven runtime on top of DAGScheduler that tracks a
+    PENDING/RUNNING/OK/FAILED state per step.
+    Any failed step aborts the workflow (no new steps are started).
+    reuse_shell=True runs steps without a timeout through a per-worker
+    long-lived shell (see ShellPool) instead of spawning one per step.
+    """
+    def __init__(self, ir: List[dict], workdir: str = "/tmp/flowscript_run", max_workers: Optional[int] = None,
+                 reuse_shell: bool = False, cancel_event: Optional[threading.Event] = None):
         self.ir = ir
         self.workdir = workdir
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 2) * 2)
+        self.reuse_shell = reuse_shell and os.name != "nt"
+        self.cancel_event = cancel_event
+        self.shell_pool: Optional[ShellPool] = None
+        self.compiled: Dict[str, CompiledStep] = {instr["step"]: CompiledStep(instr) for instr in ir}
         self.state = {instr["step"]: "PENDING" for instr in ir}
 
+    def _run_attempt(self, cs: CompiledStep) -> bool:
+        return run_cmd_sandbox(cs.run_target, timeout=cs.timeout_sec, cwd=self.workdir, shell_pool=self.shell_pool)
+
+    def _on_status(self, step: str, status: str):
+        self.state[step] = _STATE[status]
+
+    def _on_failure(self, step: str) -> str:
+        log.info("Step %s failed", step)
+        on_error = self.compiled[step].on_error
+        if on_error:
+            log.info("On error: %s", on_error)
+        return ABORT
+
     def execute(self) -> bool:
-        # IR must be topologically ordered by caller
-        for instr in self.ir:
-            step = instr["step"]
-            cmd = instr["cmd"] or ""
-            timeout = None
-            if instr.get("timeout"):
-                try:
-                    timeout = int(str(instr["timeout"]).rstrip("s"))
-                except Exception:
-                    timeout = None
-            retries = instr.get("retries", 0) or 0
-            ok = False
-            for attempt in range(retries + 1):
-                print(f"Running {step}, attempt {attempt+1}")
-                ok = run_cmd_sandbox(cmd, timeout=timeout, cwd=self.workdir)
-                if ok:
-                    break
-            self.state[step] = "OK" if ok else "FAILED"
-            if not ok:
-                print(f"Step {step} failed")
-                if instr.get("on_error"):
-                    print(f"On error: {instr.get('on_error')}")
-                return False
-        return True
+        if self.reuse_shell:
+            self.shell_pool = ShellPool(cwd=self.workdir)
+        try:
+            sched = DAGScheduler(list(self.compiled.values()), self._run_attempt, self.max_workers,
+                                 status_cb=self._on_status, cancel_event=self.cancel_event,
+                                 on_failure=self._on_failure)
+            ok = sched.run()
+        finally:
+            if self.shell_pool is not None:
+                self.shell_pool.close()
+                self.shell_pool = None
+        # steps left PENDING were never reached (failure upstream or a cycle)
+        return ok and all(st == "OK" for st in self.state.values())
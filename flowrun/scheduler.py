@@ -0,0 +1,202 @@
+# flowrun/scheduler.py
+import graphlib
+import heapq
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, List, Optional, Set
+
+from flowrun.executor import CompiledStep
+from flowrun.graph import StepGraph
+from flowc.semantic import SemanticError
+
+log = logging.getLogger("flowrun")
+
+# what on_failure(step) tells the scheduler to do with a failed step
+ABORT = "abort"                    # stop the run (same as no hook)
+CONTINUE = "continue"              # keep going and release the step's dependents
+SKIP_DEPENDENTS = "skip"           # keep going; the step's dependents never start
+
+class DAGScheduler:
+    """
+    Dependency-driven step scheduler shared by ParallelRuntime, ParallelVM
+    and Runtime; they only supply how to run one attempt and what to do on
+    failure.
+      - ready steps run highest bottom level (timeout-weighted critical
+        path) first; at most max_workers steps are in flight at a time.
+      - the thread calling run() owns all scheduler state; workers only run
+        attempts and hand their future back through done_q.
+      - status_cb(step, status) gets 'queued','running','succeeded','failed'.
+      - a failed step calls on_failure(step), which returns ABORT, CONTINUE
+        (dependents are released) or SKIP_DEPENDENTS (other steps go on, the
+        failed step's dependents are never started); no hook means ABORT.
+      - cancel_event aborts the run; in-flight steps stop before their next
+        attempt and are waited for before run() returns.
+      - an injected executor is shared: it is not shut down.
+      - unknown deps and cycles raise SemanticError at construction, so a
+        cycle behind a root can't silently leave steps unexecuted.
+    One instance runs once (indegrees are consumed).
+    """
+    def __init__(self, nodes: List[CompiledStep], run_attempt: Callable[[CompiledStep], bool],
+                 max_workers: int, executor: Optional[ThreadPoolExecutor] = None,
+                 status_cb: Optional[Callable[[str, str], None]] = None,
+                 cancel_event: Optional[threading.Event] = None,
+                 on_failure: Optional[Callable[[str], str]] = None):
+        self.nodes: Dict[str, CompiledStep] = {cs.name: cs for cs in nodes}
+        self.run_attempt = run_attempt
+        self.max_workers = max_workers
+        self.executor = executor
+        self.status_cb = status_cb
+        self.cancel_event = cancel_event
+        self.on_failure = on_failure
+
+        self.graph = StepGraph({name: cs.depends_on for name, cs in self.nodes.items()})
+        ts = graphlib.TopologicalSorter()
+        for name, cs in self.nodes.items():
+            ts.add(name, *cs.depends_on)
+        try:
+            order = [self.graph.name_to_id[n] for n in ts.static_order()]
+        except graphlib.CycleError as e:
+            raise SemanticError(f"Cycle detected in step dependencies: {' -> '.join(e.args[1])}")
+        # critical-path priority: a step weighs its timeout in seconds (1 if none)
+        self.bottomL: List[int] = self.graph.bottom_levels(order, [self.nodes[n].timeout_sec or 1 for n in self.graph.names])
+
+        self.completed: Set[str] = set()
+        self.failed: Set[str] = set()
+        self.running_futures: Dict[Future, str] = {}
+        self.done_q = queue.Queue()
+        self.ready_pq: List[tuple] = []  # heap of (-bottomL, step id)
+        self.outstanding = 0  # submitted but not yet handled by the driver
+        self.cancelled = False
+
+    def _report(self, step: str, status: str):
+        if self.status_cb is not None:
+            try:
+                self.status_cb(step, status)
+            except Exception:
+                pass
+
+    def _cancel_requested(self) -> bool:
+        return self.cancelled or (self.cancel_event is not None and self.cancel_event.is_set())
+
+    def _execute_step(self, step: str) -> bool:
+        # runs in a worker; the final succeeded/failed status is reported by the driver
+        cs = self.nodes[step]
+        self._report(step, "running")
+        for attempt in range(cs.retries_plus_1):
+            if self._cancel_requested():
+                return False
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("[%s] attempt %d/%d", step, attempt + 1, cs.retries_plus_1)
+            if self.run_attempt(cs):
+                return True
+        return False
+
+    def _push_ready(self, i: int):
+        heapq.heappush(self.ready_pq, (-self.bottomL[i], i))
+        self._report(self.graph.names[i], "queued")
+
+    def _submit(self, ex: ThreadPoolExecutor, step: str):
+        fut = ex.submit(self._execute_step, step)
+        self.running_futures[fut] = step
+        # completions are pushed to done_q; the driver loop consumes them
+        fut.add_done_callback(lambda f: self.done_q.put((f, step)))
+
+    def _submit_ready(self, ex: ThreadPoolExecutor):
+        # keep at most max_workers steps in flight; the rest wait in the heap
+        while self.ready_pq and self.outstanding < self.max_workers:
+            _, i = heapq.heappop(self.ready_pq)
+            self.outstanding += 1
+            self._submit(ex, self.graph.names[i])
+
+    def _release_dependents(self, step: str):
+        # children of a step are a flat slice of the CSR targets
+        g = self.graph
+        i = g.name_to_id[step]
+        indeg = g.indeg
+        for t in g.targets[g.offsets[i]:g.offsets[i + 1]]:
+            indeg[t] -= 1
+            if indeg[t] == 0:
+                self._push_ready(t)
+
+    def _abort(self):
+        # no lock to hold: take the in-flight set and cancel best-effort.
+        # Queued futures are dropped; running ones finish their attempt and
+        # see self.cancelled before the next one
+        self.cancelled = True
+        pending, self.running_futures = self.running_futures, {}
+        for f in pending:
+            f.cancel()
+
+    def _result(self, fut: Future, step: str) -> bool:
+        try:
+            ok = fut.result()
+        except Exception as e:
+            ok = False
+            log.error("[%s] raised exception: %s", step, e)
+        self._report(step, "succeeded" if ok else "failed")
+        (self.completed if ok else self.failed).add(step)
+        return ok
+
+    def _next_done(self):
+        fut, step = self.done_q.get()
+        self.outstanding -= 1
+        self.running_futures.pop(fut, None)
+        return fut, step
+
+    def _drain_after_abort(self):
+        # wait for every step still in flight to finish (or be cancelled;
+        # cancelled futures run their done callback too) and report it
+        while self.outstanding:
+            self._result(*self._next_done())
+
+    def _drive(self, ex: ThreadPoolExecutor) -> bool:
+        """
+        Run the ready heap to completion on ex; returns True if the run was
+        aborted (failure not handled by on_failure, or cancel).
+        """
+        self._submit_ready(ex)
+        while self.outstanding:
+            fut, step = self._next_done()
+            if self._result(fut, step):
+                self._release_dependents(step)
+            else:
+                outcome = self.on_failure(step) if self.on_failure is not None else ABORT
+                if outcome == CONTINUE:
+                    self._release_dependents(step)
+                elif outcome != SKIP_DEPENDENTS:
+                    self._abort()
+                    return True
+
+            if self._cancel_requested():
+                log.info("Cancel requested; aborting")
+                self._abort()
+                return True
+
+            # a worker slot was freed: refill it from the ready heap
+            self._submit_ready(ex)
+        return False
+
+    def run(self) -> bool:
+        """
+        Run every step; True only if all of them succeeded.
+        """
+        # the graph is acyclic (checked at construction), so every step is
+        # reachable from a root
+        for i in self.graph.roots():
+            self._push_ready(i)
+
+        if self.executor is not None:
+            aborted = self._drive(self.executor)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+                aborted = self._drive(ex)
+        if aborted:
+            self._drain_after_abort()
+            return False
+        skipped = len(self.nodes) - len(self.completed) - len(self.failed)
+        if skipped:
+            # only SKIP_DEPENDENTS leaves steps unstarted, so failed is non-empty
+            log.info("%d step(s) skipped: a dependency failed", skipped)
+        return not self.failed
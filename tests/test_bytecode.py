@@ -0,0 +1,29 @@
+# tests/test_bytecode.py
+import pytest
+
+from flowc.bytecode import emit_bytecode
+from flowrun.vm import load_bytecode
+
+IR = [
+    {"step": "a", "cmd": "echo 'é'", "timeout": "5s", "timeout_sec": 5, "retries": 1,
+     "depends_on": [], "on_error": "n"},
+    {"step": "b", "cmd": "true", "timeout": None, "timeout_sec": None, "retries": 0,
+     "depends_on": ["a"], "on_error": None},
+]
+NOTIFIES = [{"name": "n", "email": "ops@example.com", "subject": "s", "body": "${failed_step} failed"}]
+EXPECTED = {"workflow": "w", "steps": IR, "notifies": NOTIFIES}
+
+@pytest.mark.parametrize("name,fmt", [
+    ("w.bc.json", None),
+    ("w.bc.msgpack", None),
+    ("w.bc.json", "msgpack"),   # the loader sniffs the content, not the extension
+    ("w.bc.msgpack", "json"),
+])
+def test_bytecode_round_trips(tmp_path, name, fmt):
+    written_fmt = fmt or ("msgpack" if name.endswith(".msgpack") else "json")
+    if written_fmt == "msgpack":
+        pytest.importorskip("msgpack")
+    path = emit_bytecode("w", IR, str(tmp_path / name), NOTIFIES, fmt=fmt)
+    with open(path, "rb") as f:
+        assert (f.read(1) == b"{") == (written_fmt == "json")
+    assert load_bytecode(path) == EXPECTED
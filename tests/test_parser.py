@@ -1,3 +1,6 @@
+import os
+import threading
+
 from flowc import parser
 
 
@@ -7,4 +10,16 @@ EXAMPLE = open('examples/backup.flow').read()
 def test_parse_example():
     ast = parser.parse(EXAMPLE)
     assert ast.name == 'backup_and_notify'
-    assert len(ast.steps) >= 2
\ No newline at end of file
+    assert len(ast.steps) >= 2
+
+
+def test_read_source_reads_pipes(tmp_path):
+    # a FIFO reports st_size 0 like <(...) process substitution does
+    fifo = tmp_path / 'src.flow'
+    os.mkfifo(fifo)
+    writer = threading.Thread(target=fifo.write_text, args=(EXAMPLE,), kwargs={'encoding': 'utf-8'})
+    writer.start()
+    try:
+        assert parser.read_source(str(fifo)) == EXAMPLE
+    finally:
+        writer.join()
@@ -0,0 +1,96 @@
+# tests/test_runtime.py
+import shutil
+
+import pytest
+
+from flowrun.runtime import Runtime
+from flowrun.runtime_parallel import ParallelRuntime
+from flowrun.vm import ParallelVM
+from flowrun.executor import ShellPool, _compile_argv
+
+def _instr(step, cmd, deps=(), on_error=None):
+    return {"step": step, "cmd": cmd, "timeout": None, "retries": 0,
+            "depends_on": list(deps), "on_error": on_error}
+
+DIAMOND = [
+    _instr("a", "true"),
+    _instr("b", "true", ["a"]),
+    _instr("c", "true", ["a"]),
+    _instr("d", "true", ["b", "c"]),
+]
+
+@pytest.mark.parametrize("reuse_shell", [False, True])
+def test_runtime_runs_diamond(tmp_path, reuse_shell):
+    rt = Runtime(DIAMOND, workdir=str(tmp_path), max_workers=2, reuse_shell=reuse_shell)
+    assert rt.execute()
+    assert rt.state == {"a": "OK", "b": "OK", "c": "OK", "d": "OK"}
+
+@pytest.mark.parametrize("reuse_shell", [False, True])
+def test_runtime_failure_leaves_dependents_pending(tmp_path, reuse_shell):
+    ir = [_instr("a", "true"), _instr("b", "false", ["a"]), _instr("c", "true", ["b"])]
+    rt = Runtime(ir, workdir=str(tmp_path), reuse_shell=reuse_shell)
+    assert not rt.execute()
+    assert rt.state == {"a": "OK", "b": "FAILED", "c": "PENDING"}
+
+def test_parallel_runtime_runs_dependents_as_they_unlock(tmp_path):
+    rt = ParallelRuntime(DIAMOND, workdir=str(tmp_path), max_workers=2)
+    assert rt.execute()
+    assert rt.completed == {"a", "b", "c", "d"}
+
+def test_vm_aborts_on_failure_without_on_error(tmp_path):
+    ir = [_instr("a", "true"), _instr("b", "false", ["a"]), _instr("c", "true", ["b"])]
+    seen = []
+    vm = ParallelVM({"steps": ir}, workdir=str(tmp_path), status_callback=lambda s, st: seen.append((s, st)))
+    assert not vm.execute()
+    assert ("b", "failed") in seen
+    assert all(s != "c" for s, _ in seen)
+
+def test_cycle_behind_root_is_rejected(tmp_path):
+    ir = [_instr("a", "true"), _instr("b", "true", ["a", "c"]), _instr("c", "true", ["b"])]
+    vm = ParallelVM({"steps": ir}, workdir=str(tmp_path))
+    assert not vm.execute()
+    assert not vm.completed
+
+def test_parallel_runtime_on_error_skips_dependents(tmp_path):
+    ir = [_instr("a", "false", on_error="n"), _instr("b", "true", ["a"]), _instr("c", "true")]
+    rt = ParallelRuntime(ir, workdir=str(tmp_path))
+    assert not rt.execute()
+    assert rt.failed == {"a"}
+    assert rt.completed == {"c"}
+
+def test_shell_pool_keeps_one_shell_across_odd_commands(tmp_path):
+    pool = ShellPool(cwd=str(tmp_path))
+    try:
+        assert not pool.run("exit 3")
+        sh = pool._local.shell
+        assert pool.run("true")
+        assert pool.run("cd /")
+        assert pool.run(f'test "$(pwd)" = "{tmp_path}"')
+        assert not pool.run("if then fi")
+        assert pool.run("cat")  # stdin is /dev/null, so this must not hang
+        assert pool.run("printf x")  # output without a trailing newline
+        assert pool._local.shell is sh
+    finally:
+        pool.close()
+
+@pytest.mark.parametrize("cmd", [
+    "cd /tmp", "export X=1", "exit 1", "read x", "umask 077", "exec true", ". ./env", "source env",
+    "if true", "for x in a", "time true",       # builtins / reserved words
+    "X=1 env", "A=b",                           # assignments
+    "echo 'unterminated",                       # bad quoting
+    "echo a | cat", "true && true", "true; true", "echo x > f", "cat < f", "(true)", "echo $HOME",
+    "echo `id`", "ls *.py", "ls ?", "ls [ab]", "echo {a,b}", "ls ~", "true # c", "! false",
+    "echo \\x", "true\ntrue",                 # each metacharacter class
+    "./run.sh", "/bin/true", "no-such-command-here", "", "   ",
+])
+def test_compile_argv_leaves_shell_syntax_to_the_shell(cmd):
+    assert _compile_argv(cmd) is None
+
+@pytest.mark.parametrize("cmd,argv", [
+    ("true", ["true"]),
+    ("echo hello world", ["echo", "hello", "world"]),
+    ("echo 'a b' \"c d\"", ["echo", "a b", "c d"]),
+    ("env -i", ["env", "-i"]),
+])
+def test_compile_argv_resolves_plain_commands_on_path(cmd, argv):
+    assert _compile_argv(cmd) == [shutil.which(argv[0])] + argv[1:]
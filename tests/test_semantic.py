@@ -1,4 +1,6 @@
 # tests/test_semantic.py
+import pytest
+
 from flowc import parser
 from flowc import semantic
 
@@ -17,3 +19,51 @@ def test_cycle_detection():
         assert False, "Cycle not detected"
     except Exception:
         assert True
+
+def test_banned_command_reports_pattern():
+    from flowc.ast import Step
+    steps = [Step(name="ok", run="echo ok"), Step(name="bad", run="cat a >> b")]
+    try:
+        semantic.check_banned_commands(steps)
+        assert False, "Banned pattern not detected"
+    except semantic.SemanticError as e:
+        assert "'bad'" in str(e) and "(>>)" in str(e)
+
+def test_build_dag_detects_cycle():
+    from flowc.ast import Step
+    steps = [
+        Step(name="root"),
+        Step(name="a", depends_on=["root", "b"]),
+        Step(name="b", depends_on=["a"]),
+    ]
+    try:
+        semantic.build_dag(steps)
+        assert False, "Cycle not detected"
+    except semantic.SemanticError as e:
+        assert "Cycle detected" in str(e)
+
+def test_build_dag_rejects_unknown_dependency():
+    from flowc.ast import Step
+    with pytest.raises(semantic.SemanticError, match="missing step 'nope'"):
+        semantic.build_dag([Step(name="a", depends_on=["nope"])])
+
+BANNED_CASES = [
+    ("echo ok", None),
+    ("a | b", r"(^|;|\s)\|(\s|$)"),
+    ("a\xa0|\xa0b", r"(^|;|\s)\|(\s|$)"),  # sh still runs this as a pipe
+    ("a|b", None),
+    ("rm  -rf /tmp/x", r"rm\s+-rf"),
+    ("cat a >> b", "(>>)"),
+    ("sleep 1 &", r"(^|;|\s)&(\s|$)"),
+    ("echo `id`", "`"),
+    ("echo 'héllo'", None),
+]
+
+@pytest.mark.parametrize("backend", ["re", "hyperscan"])
+@pytest.mark.parametrize("cmd,expected", BANNED_CASES)
+def test_banned_patterns_match_the_same_with_either_backend(monkeypatch, backend, cmd, expected):
+    if backend == "re":
+        monkeypatch.setattr(semantic, "_BANNED_HS", None)
+    elif semantic._BANNED_HS is None:
+        pytest.skip("hyperscan not installed")
+    assert semantic._find_banned(cmd) == expected
@@ -4,14 +4,18 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-import uuid, time, threading, queue
-from flask import Flask, request, render_template, send_file, jsonify, Response, redirect, url_for
+import ctypes, dataclasses, itertools, json, select, uuid, time, threading, queue
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, render_template, send_file, Response, redirect, url_for
 from flask_cors import CORS
+from werkzeug.exceptions import BadRequest
 from werkzeug.utils import secure_filename
 
 from flowc import parser, semantic, ir as irmod, bytecode as bcmod
+from flowc._compat import orjson
 from flowc.visualize import workflow_to_dot, render_workflow_to_file
-from flowrun.vm import ParallelVM, load_bytecode
+from flowrun.vm import ParallelVM, get_bytecode
 
 UPLOAD_DIR = os.path.abspath("webui_uploads")
 OUT_DIR = os.path.abspath("webui_out")
@@ -26,70 +30,164 @@ CORS(app)
 # RUNS structure:
 # RUNS[run_id] = {
 #   thread, stop_event (threading.Event), log_path, status: str,
-#   done: bool, status_q: queue.Queue, status_map: {step:status}
+#   done: bool, status_dq: deque of (step, status), status_wake: threading.Event,
+#   status_map: {step:status}, status_ver (bumped after each map change),
+#   status_ver_seq, status_snapshot: (status_ver it was built at, bytes),
+#   log_q, log_fh, log_writer (see log_writer_loop)
 # }
-RUNS = {}
+# RUNS_LOCK guards inserts/evictions only; single RUNS.get() lookups are
+# atomic. At most MAX_RUNS are kept, evicting the oldest finished runs.
+RUNS = OrderedDict()
+RUNS_LOCK = threading.Lock()
+MAX_RUNS = 256
+
+def register_run(run_id, info):
+    with RUNS_LOCK:
+        RUNS[run_id] = info
+        if len(RUNS) > MAX_RUNS:
+            for rid in [rid for rid, i in RUNS.items() if i.get("done")][:len(RUNS) - MAX_RUNS]:
+                del RUNS[rid]
+
+# step workers shared by all runs, so starting a run doesn't spawn (and
+# stopping it join) a fresh pool; each run caps its own in-flight steps
+GLOBAL_POOL = ThreadPoolExecutor(max_workers=max(32, (os.cpu_count() or 2) * 4), thread_name_prefix="flow")
+
+# /files listing cache, keyed by the upload dir's mtime; upload/save reset it
+FILES_CACHE = {"mtime": 0, "names": []}
+FILES_LOCK = threading.Lock()
 
 def allowed_filename(filename):
     _, ext = os.path.splitext(filename)
     return ext.lower() in ALLOWED_EXT
 
+def invalidate_files_cache():
+    with FILES_LOCK:
+        FILES_CACHE["mtime"] = 0
+
+# inotify (Linux) lets log tails sleep until the file changes instead of
+# polling it; elsewhere (or if inotify is unavailable) we fall back to polling
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+_LIBC = None
+
+def inotify_watch(path):
+    """
+    Return a non-blocking inotify fd watching path for writes, or None.
+    """
+    global _LIBC
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        if _LIBC is None:
+            _LIBC = ctypes.CDLL(None, use_errno=True)
+        fd = _LIBC.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if _LIBC.inotify_add_watch(fd, os.fsencode(path), IN_MODIFY | IN_CLOSE_WRITE) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+def wait_for_change(fd, timeout):
+    # block until the watched file changes (or timeout); drain queued events
+    if fd is None:
+        time.sleep(timeout)
+        return
+    ready, _, _ = select.select([fd], [], [], timeout)
+    if ready:
+        try:
+            while os.read(fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
 def sse_stream_file(log_path, stop_event):
-    last_pos = 0
     open(log_path, "a").close()
-    with open(log_path, "r", encoding="utf-8", errors="ignore") as fh:
-        fh.seek(0, os.SEEK_END)
-        last_pos = fh.tell()
-    while not stop_event.is_set():
+    # watch before the first read so no append can slip in unnoticed
+    fd = inotify_watch(log_path)
+    poll_interval = 0.5 if fd is not None else 0.3
+    try:
         with open(log_path, "r", encoding="utf-8", errors="ignore") as fh:
-            fh.seek(last_pos)
+            fh.seek(0, os.SEEK_END)
+            while not stop_event.is_set():
+                data = fh.read()
+                if data:
+                    for line in data.splitlines():
+                        yield f"data: {line}\n\n"
+                else:
+                    wait_for_change(fd, poll_interval)
+            # final flush
             data = fh.read()
             if data:
-                last_pos = fh.tell()
                 for line in data.splitlines():
                     yield f"data: {line}\n\n"
-            else:
-                time.sleep(0.3)
-    # final flush
-    with open(log_path, "r", encoding="utf-8", errors="ignore") as fh:
-        fh.seek(last_pos)
-        data = fh.read()
-        if data:
-            for line in data.splitlines():
-                yield f"data: {line}\n\n"
+    finally:
+        if fd is not None:
+            os.close(fd)
     yield "data: [STREAM-CLOSED]\n\n"
 
+def dumps_bytes(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+def fast_jsonify(obj):
+    return Response(dumps_bytes(obj), mimetype="application/json")
+
+def request_json():
+    # an empty or absent body reads as {}
+    data = request.get_data(cache=False)
+    if not data:
+        return {}
+    try:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+    except ValueError:
+        raise BadRequest("Invalid JSON body")
+
+def status_event(step, status):
+    return b"data: " + dumps_bytes({"type": "status", "step": step, "status": status}) + b"\n\n"
+
 def sse_stream_status(run_id):
     info = RUNS.get(run_id)
     if not info:
-        yield "data: {}\n\n"
+        yield b"data: {}\n\n"
         return
-    q = info["status_q"]
-    # immediate dump of current map
-    try:
-        for step, st in info.get("status_map", {}).items():
-            yield f"data: {{\"type\":\"status\",\"step\":\"{step}\",\"status\":\"{st}\"}}\n\n"
-    except Exception:
-        pass
+    dq = info["status_dq"]
+    wake = info["status_wake"]
+    # immediate dump of current map; the encoded snapshot is shared by all
+    # clients while status_ver is unchanged. Reading the version before
+    # building means a snapshot that races a status change is stored under
+    # the old version and never served.
+    ver = info["status_ver"]
+    snap_ver, snapshot = info["status_snapshot"]
+    if snap_ver != ver:
+        snapshot = b"".join(status_event(step, st) for step, st in list(info.get("status_map", {}).items()))
+        info["status_snapshot"] = (ver, snapshot)
+    if snapshot:
+        yield snapshot
     while True:
         try:
-            item = q.get(timeout=0.5)
             # item is (step, status)
-            step, st = item
-            yield f"data: {{\"type\":\"status\",\"step\":\"{step}\",\"status\":\"{st}\"}}\n\n"
-            if info.get("done") and q.empty():
-                break
-        except queue.Empty:
+            step, st = dq.popleft()
+        except IndexError:
             # if run done and queue empty -> exit
             if info.get("done"):
                 break
+            wake.wait(timeout=0.5)
+            wake.clear()
             continue
-    yield "data: [STATUS-STREAM-CLOSED]\n\n"
+        yield status_event(step, st)
+    yield b"data: [STATUS-STREAM-CLOSED]\n\n"
 
 def status_callback_factory(run_id):
     """
     Returns a callback that VM calls as status_callback(step, status)
-    It will write to RUNS[run_id]["status_q"] and update status_map and the log file.
+    It will append to RUNS[run_id]["status_dq"], update status_map and queue a
+    line for the run's log writer.
     """
     def cb(step, status):
         info = RUNS.get(run_id)
@@ -97,18 +195,45 @@ def status_callback_factory(run_id):
             return
         # update map
         info["status_map"][step] = status
-        # push to queue
-        try:
-            info["status_q"].put((step, status), block=False)
-        except Exception:
-            pass
-        # also append to log file
+        # after the map update; next() hands out unique versions across workers
+        info["status_ver"] = next(info["status_ver_seq"])
+        # deque append is atomic; the event wakes the SSE streamer
+        info["status_dq"].append((step, status))
+        info["status_wake"].set()
+        # the log writer thread formats and appends it
+        info["log_q"].put_nowait((time.time(), step, status))
+    return cb
+
+def log_writer_loop(log_q, fh):
+    """
+    Drain a run's log queue into its (already open) log file, one
+    writelines()+flush() per batch instead of open/write/close per event.
+    A None item stops the writer.
+    """
+    while True:
+        batch = [log_q.get()]
+        while len(batch) < 256:
+            try:
+                batch.append(log_q.get_nowait())
+            except queue.Empty:
+                break
+        lines = []
+        stop = False
+        for item in batch:
+            if item is None:
+                stop = True
+            elif isinstance(item, str):
+                lines.append(item)
+            else:
+                ts, step, status = item
+                lines.append(f"[{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))}] STATUS {step} -> {status}\n")
         try:
-            with open(info["log_path"], "a", encoding="utf-8") as fh:
-                fh.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] STATUS {step} -> {status}\n")
+            fh.writelines(lines)
+            fh.flush()
         except Exception:
             pass
-    return cb
+        if stop:
+            return
 
 def run_workflow_background(run_id, bytecode_path, mem_limit_mb, max_workers, workdir):
     run_info = RUNS[run_id]
@@ -117,27 +242,28 @@ def run_workflow_background(run_id, bytecode_path, mem_limit_mb, max_workers, wo
     cb = status_callback_factory(run_id)
     cancel_event = run_info["stop_event"]
 
-    vm = ParallelVM(load_bytecode(bytecode_path),
-                    workdir=workdir,
-                    mem_limit_mb=mem_limit_mb,
-                    max_workers=max_workers,
-                    status_callback=cb,
-                    cancel_event=cancel_event)
-    # execute
     try:
+        vm = ParallelVM(get_bytecode(bytecode_path),
+                        workdir=workdir,
+                        mem_limit_mb=mem_limit_mb,
+                        max_workers=max_workers,
+                        status_callback=cb,
+                        cancel_event=cancel_event,
+                        executor=GLOBAL_POOL)
         ok = vm.execute()
         run_info["status"] = "finished" if ok else "failed"
     except Exception as e:
-        with open(run_info["log_path"], "a", encoding="utf-8") as fh:
-            fh.write(f"[EXCEPTION] {e}\n")
+        run_info["log_q"].put_nowait(f"[EXCEPTION] {e}\n")
         run_info["status"] = "error"
     finally:
+        # flush every queued line before the run is reported done
+        run_info["log_q"].put_nowait(None)
+        run_info["log_writer"].join()
+        run_info["log_fh"].close()
+        # queue the end marker before flagging done so streamers still see it
+        run_info["status_dq"].append(("__done__", "1"))
         run_info["done"] = True
-        # ensure last statuses are pushed
-        try:
-            run_info["status_q"].put(("__done__", "1"), block=False)
-        except Exception:
-            pass
+        run_info["status_wake"].set()
 
 @app.route("/")
 def index():
@@ -145,11 +271,17 @@ def index():
 
 @app.route("/files")
 def files_api():
-    out = []
-    for fn in os.listdir(UPLOAD_DIR):
-        if allowed_filename(fn):
-            out.append(fn)
-    return jsonify(sorted(out))
+    mtime = os.stat(UPLOAD_DIR).st_mtime_ns
+    with FILES_LOCK:
+        if FILES_CACHE["mtime"] == mtime:
+            return fast_jsonify(FILES_CACHE["names"])
+    # scandir yields names without a stat per entry
+    with os.scandir(UPLOAD_DIR) as it:
+        names = sorted(e.name for e in it if allowed_filename(e.name))
+    with FILES_LOCK:
+        FILES_CACHE["mtime"] = mtime
+        FILES_CACHE["names"] = names
+    return fast_jsonify(names)
 
 @app.route("/upload", methods=["POST"])
 def upload():
@@ -161,6 +293,7 @@ def upload():
         return "Invalid file type", 400
     dest = os.path.join(UPLOAD_DIR, filename)
     f.save(dest)
+    invalidate_files_cache()
     return redirect(url_for("index"))
 
 @app.route("/raw/<filename>")
@@ -172,12 +305,13 @@ def raw_file(filename):
 
 @app.route("/save/<filename>", methods=["POST"])
 def save_file(filename):
-    data = request.json or {}
+    data = request_json()
     content = data.get("content", "")
     path = os.path.join(UPLOAD_DIR, filename)
     with open(path, "w", encoding="utf-8") as fh:
         fh.write(content)
-    return jsonify({"ok": True})
+    invalidate_files_cache()
+    return fast_jsonify({"ok": True})
 
 @app.route("/emit/<filename>", methods=["POST"])
 def emit_bytecode_endpoint(filename):
@@ -188,15 +322,13 @@ def emit_bytecode_endpoint(filename):
         with open(src_path, "r", encoding="utf-8") as fh:
             src = fh.read()
         ast = parser.parse(src)
-        semantic.semantic_check(ast)
+        order = semantic.semantic_check(ast)
     except Exception as e:
         return f"Parse/semantic error: {e}", 400
 
-    ir = irmod.workflow_to_ir(ast)
+    ir = irmod.workflow_to_ir(ast, order=order)
     outbc = os.path.join(OUT_DIR, f"{filename}.bc.json")
-    notifies = []
-    for n in getattr(ast, "notifies", []):
-        notifies.append({"name": n.name, "email": n.email, "subject": n.subject, "body": n.body})
+    notifies = [dataclasses.asdict(n) for n in ast.notifies]
     bcmod.emit_bytecode(ast.name, ir, outbc, notifies=notifies)
 
     # render SVG (for interactive coloring), store as .svg
@@ -209,7 +341,7 @@ def emit_bytecode_endpoint(filename):
         svg_base = svg_out
     dot.render(svg_base, cleanup=True)
     # dot.render creates svg_out; return base filename
-    return jsonify({"bytecode": os.path.basename(outbc), "dag_svg": os.path.basename(svg_out)})
+    return fast_jsonify({"bytecode": os.path.basename(outbc), "dag_svg": os.path.basename(svg_out)})
 
 @app.route("/dag/<fname>")
 def get_dag(fname):
@@ -220,7 +352,7 @@ def get_dag(fname):
 
 @app.route("/start", methods=["POST"])
 def start_run():
-    data = request.json or {}
+    data = request_json()
     bcname = data.get("bytecode")
     if not bcname:
         return "bytecode param required", 400
@@ -234,21 +366,33 @@ def start_run():
     run_dir = os.path.join(OUT_DIR, f"run_{run_id}")
     os.makedirs(run_dir, exist_ok=True)
     log_path = os.path.join(run_dir, "run.log")
+    log_q = queue.Queue()
+    log_fh = open(log_path, "a", encoding="utf-8", buffering=1 << 16)
+    log_writer = threading.Thread(target=log_writer_loop, args=(log_q, log_fh), daemon=True)
+    log_writer.start()
 
-    RUNS[run_id] = {
+    info = {
         "thread": None,
         "stop_event": threading.Event(),
         "log_path": log_path,
         "status": "queued",
         "done": False,
-        "status_q": queue.Queue(),
-        "status_map": {}
+        "status_dq": deque(),
+        "status_wake": threading.Event(),
+        "status_map": {},
+        "status_ver": 0,
+        "status_ver_seq": itertools.count(1),
+        "status_snapshot": (0, b""),
+        "log_q": log_q,
+        "log_fh": log_fh,
+        "log_writer": log_writer,
     }
 
     t = threading.Thread(target=run_workflow_background, args=(run_id, bcpath, mem, workers, run_dir), daemon=True)
-    RUNS[run_id]["thread"] = t
+    info["thread"] = t
+    register_run(run_id, info)
     t.start()
-    return jsonify({"run_id": run_id})
+    return fast_jsonify({"run_id": run_id})
 
 @app.route("/stop/<run_id>", methods=["POST"])
 def stop_run(run_id):
@@ -257,7 +401,7 @@ def stop_run(run_id):
         return "run not found", 404
     info["stop_event"].set()
     info["status"] = "stopping"
-    return jsonify({"ok": True})
+    return fast_jsonify({"ok": True})
 
 @app.route("/logs/<run_id>")
 def get_logs(run_id):
@@ -287,10 +431,11 @@ def stream_status(run_id):
 
 @app.route("/runs")
 def list_runs():
-    out = {}
-    for rid, info in RUNS.items():
-        out[rid] = {"status": info["status"], "log": os.path.basename(info["log_path"]), "done": info.get("done", False)}
-    return jsonify(out)
+    with RUNS_LOCK:
+        snapshot = list(RUNS.items())
+    out = {rid: {"status": info["status"], "log": os.path.basename(info["log_path"]), "done": info.get("done", False)}
+           for rid, info in snapshot}
+    return fast_jsonify(out)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)